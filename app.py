@@ -1,71 +1,156 @@
+import codecs
 import io
 import re
+import chardet
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 import streamlit as st
 
 st.set_page_config(page_title="REInbox CSV Cleaner", page_icon="🧹", layout="wide")
 st.title("REInbox CSV Cleaner 🧹 (DealMachine - multi-contact aware)")
 
-# Liberal but solid email regex
-EMAIL_RE = re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}", re.I)
+# Liberal but solid email regex. The lookbehind only lets a match start at the beginning
+# of a run of address characters; without it findall retries from every position inside
+# the run, which is quadratic on long junk cells (e.g. pasted HTML). Trade-off: an address
+# glued onto the end of another ("h@i.com_j@k.com") no longer yields a second match.
+EMAIL_RE = re.compile(r"(?<![A-Za-z0-9._%+\-])[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}", re.I)
+
+# Quick sanity check (not MX/SMTP), meant for fullmatch: no leading/trailing
+# dot or hyphen in the local part, no "..", domain labels non-empty and not
+# starting/ending with a hyphen, alphabetic TLD of 2+ chars
+VALID_EMAIL_RE = re.compile(
+    r"[A-Za-z0-9_%+](?:(?:\.?[A-Za-z0-9_%+\-])*\.?[A-Za-z0-9_%+])?"
+    r"@(?:[A-Za-z0-9](?:[A-Za-z0-9\-]*[A-Za-z0-9])?\.)+[A-Za-z]{2,}",
+    re.I,
+)
+
+# DealMachine per-contact headers: contact_N_email / contact_N_flags
+CONTACT_RE = re.compile(r"contact_(\d+)_(email|flags)$", re.I)
+
+# Phrase sets (case-insensitive substring match against Flags)
+renters_only = [
+    "resident, likely renting",
+    "likely renting",
+    "renter",
+]
+owner_excl = [
+    "likely owner, resident",
+    "likely owner",
+    "likely owner, family",
+]
+RENTER_RE = re.compile("|".join(map(re.escape, renters_only)), re.I)
+OWNER_RE = re.compile("|".join(map(re.escape, owner_excl)), re.I)
+
+def decodes_as(file_bytes: bytes, enc: str) -> bool:
+    """Whether the whole file decodes with enc (in 1 MB steps, so no full-size str is built)."""
+    view = memoryview(file_bytes)
+    try:
+        decoder = codecs.getincrementaldecoder(enc)()
+        for start in range(0, len(view), 1 << 20):
+            decoder.decode(view[start:start + (1 << 20)])
+        decoder.decode(b"", final=True)
+    except (LookupError, UnicodeDecodeError):
+        return False
+    return True
+
+def csv_encodings(file_bytes: bytes) -> list[str]:
+    """
+    Encodings to try: the one sniffed from a 4 KB sample, then latin-1 as a last resort.
+    The sniffed one is dropped up front if any later byte doesn't decode, so the header-only
+    read (load_columns) and the full read (robust_read_csv) always settle on the same encoding.
+    """
+    guess = chardet.detect(file_bytes[:4096])
+    enc = guess["encoding"] if guess["encoding"] and guess["confidence"] > 0.6 else "utf-8"
+    if enc.lower() == "ascii":
+        # An ASCII-only sample says nothing about the rest of the file; utf-8 is a superset
+        enc = "utf-8"
+    if not decodes_as(file_bytes, enc):
+        return ["latin-1"]
+    return list(dict.fromkeys((enc, "latin-1")))
+
+def csv_header(file_bytes: bytes, enc: str) -> list[str]:
+    """Column names as pandas' C parser gives them (blank -> 'Unnamed: N', repeats -> 'name.1')."""
+    return list(pd.read_csv(io.BytesIO(file_bytes), encoding=enc, nrows=0).columns)
+
+# pandas' default NA strings, which its pyarrow engine hands to pyarrow as null_values
+CSV_NULLS = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+def arrow_read_csv(file_bytes: bytes, enc: str) -> pd.DataFrame:
+    """
+    Parse with pyarrow's multi-threaded reader, as pd.read_csv(engine="pyarrow") would, except
+    that date/time columns stay the strings in the file: pyarrow would type them and the
+    download would come back reformatted (2023-01-05 -> 2023-01-05 00:00:00).
+    """
+    def read(column_types: dict[str, pa.DataType]) -> pa.Table:
+        return pa_csv.read_csv(
+            io.BytesIO(file_bytes),
+            read_options=pa_csv.ReadOptions(encoding=enc),
+            convert_options=pa_csv.ConvertOptions(
+                column_types=column_types, null_values=CSV_NULLS, strings_can_be_null=True
+            ),
+        )
+
+    table = read({})
+    temporal = {f.name: pa.string() for f in table.schema if pa.types.is_temporal(f.type)}
+    if temporal:
+        # Type inference can't be switched off, so re-read with those columns pinned to string
+        table = read(temporal)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
 
 def robust_read_csv(file_bytes: bytes) -> pd.DataFrame | None:
-    """Try common encodings so weird CSVs still load."""
-    for enc in ("utf-8", "utf-8-sig", "latin-1"):
+    """
+    Try the sniffed encoding (then latin-1) so weird CSVs still load.
+    Parses with the multi-threaded pyarrow reader (Arrow-backed columns), falling back
+    to pandas' C parser for files pyarrow rejects (e.g. ragged rows).
+    """
+    for enc in csv_encodings(file_bytes):
         try:
-            return pd.read_csv(io.BytesIO(file_bytes), encoding=enc)
+            df = arrow_read_csv(file_bytes, enc)
         except Exception:
+            try:
+                df = pd.read_csv(io.BytesIO(file_bytes), encoding=enc)
+            except Exception:
+                continue
+            # Same Arrow-backed strings as the pyarrow path, so .str ops use Arrow kernels
+            for c in df.select_dtypes(include=["object", "string"]).columns:
+                df[c] = df[c].astype("string[pyarrow]")
+            return df
+        # pyarrow hands back cells it can't decode as raw bytes instead of raising
+        if any(isinstance(t, pd.ArrowDtype) and pa.types.is_binary(t.pyarrow_dtype) for t in df.dtypes):
             continue
+        # pyarrow leaves blank and repeated headers as-is; use the C parser's names so they
+        # match load_columns (and what the C parser always produced)
+        header = csv_header(file_bytes, enc)
+        if len(header) == len(df.columns) and header != list(df.columns):
+            df.columns = header
+        return df
     return None
 
 def strip_object_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Trim whitespace across all text columns."""
-    work = df.copy()
-    for c in work.select_dtypes(include=["object"]).columns:
-        work[c] = work[c].astype(str).str.strip()
-    return work
-
-def looks_valid_email(e: str) -> bool:
-    """Quick sanity checks (not MX/SMTP)."""
-    if not isinstance(e, str):
-        return False
-    e = e.strip().lower()
-    if not EMAIL_RE.fullmatch(e):
-        return False
-    if e.startswith(".") or e.endswith("."):
-        return False
-    if ".." in e:
-        return False
-    local, _, domain = e.partition("@")
-    if not local or not domain:
-        return False
-    if local.startswith((".", "-")) or local.endswith((".", "-")):
-        return False
-    if domain.startswith((".", "-")) or domain.endswith((".", "-")):
-        return False
-    labels = domain.split(".")
-    if "." not in domain or any(len(lbl) == 0 for lbl in labels):
-        return False
-    if any(lbl.startswith("-") or lbl.endswith("-") for lbl in labels):
-        return False
-    if len(labels[-1]) < 2:
-        return False
-    return True
+    """Trim whitespace across all text columns (in place; returns the same frame)."""
+    for c in df.select_dtypes(include=["object", "string"]).columns:
+        if df[c].isna().all():
+            # Nothing to trim (and pyarrow types all-empty columns as null, which has no .str)
+            continue
+        stripped = df[c].str.strip()
+        # Mixed-type columns: keep non-string cells as-is instead of nulling them
+        df[c] = stripped.fillna(df[c])
+    return df
 
-def detect_contact_indices(columns: list[str]) -> list[int]:
+def detect_contact_indices(columns: list[str]) -> set[int]:
     """Find contact_N_email / contact_N_flags slots from headers."""
     idxs = set()
     for c in columns:
-        m = re.match(r"contact_(\d+)_email$", str(c), re.I)
-        if m:
-            idxs.add(int(m.group(1)))
-    for c in columns:
-        m = re.match(r"contact_(\d+)_flags$", str(c), re.I)
+        m = CONTACT_RE.match(str(c))
         if m:
             idxs.add(int(m.group(1)))
-    return sorted(idxs)
+    return idxs
 
-def explode_by_contacts(df: pd.DataFrame, contact_idxs: list[int]) -> pd.DataFrame:
+def explode_by_contacts(df: pd.DataFrame, contact_idxs: set[int]) -> pd.DataFrame:
     """
     For each row, emit one row per contact index with Email + Flags.
     Keeps original columns, adds 'Email' and 'Flags' from matching contact_{i}_*.
@@ -78,53 +163,75 @@ def explode_by_contacts(df: pd.DataFrame, contact_idxs: list[int]) -> pd.DataFra
             out["Flags"] = pd.NA
         return out
 
-    out_rows = []
-    for _, row in df.iterrows():
-        emitted = False
-        for i in contact_idxs:
-            email_col = f"contact_{i}_email"
-            flags_col = f"contact_{i}_flags"
-            email = row.get(email_col, pd.NA)
-            flags = row.get(flags_col, pd.NA)
-
-            # Extract any/all emails from that cell
-            email_list = []
-            if pd.notna(email):
-                found = EMAIL_RE.findall(str(email))
-                email_list = list(dict.fromkeys([e.lower() for e in found]))
-
-            if not email_list:
-                new_row = row.copy()
-                new_row["Email"] = pd.NA
-                new_row["Flags"] = (str(flags).strip().lower() if pd.notna(flags) else pd.NA)
-                out_rows.append(new_row)
-                emitted = True
-            else:
-                for e in email_list:
-                    new_row = row.copy()
-                    new_row["Email"] = e
-                    new_row["Flags"] = (str(flags).strip().lower() if pd.notna(flags) else pd.NA)
-                    out_rows.append(new_row)
-                    emitted = True
-
-        if not emitted:
-            new_row = row.copy()
-            new_row["Email"] = pd.NA
-            new_row["Flags"] = pd.NA
-            out_rows.append(new_row)
-
-    exploded = pd.DataFrame(out_rows)
-
-    # Guarantee columns exist
-    if "Email" not in exploded.columns:
-        exploded["Email"] = pd.NA
-    if "Flags" not in exploded.columns:
-        exploded["Flags"] = pd.NA
-
-    # Drop raw per-contact columns so output is clean
-    to_drop = [c for i in contact_idxs for c in (f"contact_{i}_email", f"contact_{i}_flags") if c in exploded.columns]
-    exploded = exploded.drop(columns=to_drop, errors="ignore")
-    return exploded
+    # Rename contact_{i}_email / contact_{i}_flags to Email_{i} / Flags_{i} so
+    # wide_to_long can reshape every slot in one pass; slots missing a column get NA
+    slot_cols = {}
+    for i in contact_idxs:
+        slot_cols[f"contact_{i}_email"] = f"Email_{i}"
+        slot_cols[f"contact_{i}_flags"] = f"Flags_{i}"
+    base = df.drop(columns=[*slot_cols, "Email", "Flags"], errors="ignore")
+    slots = df.reindex(columns=list(slot_cols)).rename(columns=slot_cols)
+    slots["_row"] = range(len(df))
+
+    # Only the contact columns go through the reshape; back to source row order,
+    # contact slots ascending within each row
+    long = pd.wide_to_long(slots, stubnames=["Email", "Flags"], i="_row", j="slot", sep="_").sort_index()
+
+    # Normalize Flags once per contact cell, before multi-email cells fan it out. It holds a
+    # handful of distinct phrases across all rows, so store it as categorical.
+    long["Flags"] = long["Flags"].astype("string[pyarrow]").str.strip().str.lower().astype("category")
+
+    # One row per distinct email found in the cell; cells without any keep a single NA row
+    long["Email"] = long["Email"].astype("string[pyarrow]").str.lower().str.findall(EMAIL_RE)
+    long = long.explode("Email")
+    # Repeats within one cell share its (row, slot) index, so drop them in one hash pass
+    long = long[long["Email"].isna() | ~long.set_index("Email", append=True).index.duplicated()]
+
+    # Pull each parent row once by position instead of carrying every column through the
+    # reshape, then attach Email + Flags in a single concat
+    parents = base.iloc[long.index.get_level_values("_row")].reset_index(drop=True)
+    extra = pd.DataFrame({"Email": long["Email"].astype("string[pyarrow]").array, "Flags": long["Flags"].array})
+    return pd.concat([parents, extra], axis=1)
+
+def load_csv(file_bytes: bytes, do_trim: bool) -> pd.DataFrame | None:
+    """Read and optionally trim an upload (not cached itself; only its exploded result is)."""
+    df = robust_read_csv(file_bytes)
+    if df is not None and do_trim:
+        df = strip_object_columns(df)
+    return df
+
+def always_kept(col) -> bool:
+    """Columns the explode and filters rely on, so the Keep columns picker never prunes them."""
+    return col in ("Email", "Flags") or CONTACT_RE.match(str(col)) is not None
+
+@st.cache_data(show_spinner=False, max_entries=2, ttl="1h")
+def load_columns(file_bytes: bytes) -> list[str] | None:
+    """Headers of an upload, parsed from the header line only, for the column picker."""
+    for enc in csv_encodings(file_bytes):
+        try:
+            return csv_header(file_bytes, enc)
+        except Exception:
+            continue
+    return None
+
+# Shared across sessions: keep only the most recent exploded frames, and let idle ones expire
+@st.cache_data(show_spinner=False, max_entries=2, ttl="1h")
+def load_and_explode(
+    file_bytes: bytes, do_trim: bool, keep_cols: tuple[str, ...]
+) -> tuple[pd.DataFrame, set[int], int] | None:
+    """
+    Explode an upload, carrying only keep_cols (plus the contact_N_email/flags columns) into each row.
+    Cached on all arguments so widget reruns skip straight to filtering.
+    Returns (exploded, contact_idxs, source_row_count), or None if the CSV can't be read.
+    """
+    df = load_csv(file_bytes, do_trim)
+    if df is None:
+        return None
+    contact_idxs = detect_contact_indices(list(df.columns))
+    # Prune before exploding: every kept column is copied once per emitted row
+    keep = set(keep_cols)
+    df = df[[c for c in df.columns if c in keep or always_kept(c)]]
+    return explode_by_contacts(df, contact_idxs), contact_idxs, len(df)
 
 # ---------------- Sidebar UI ----------------
 with st.sidebar:
@@ -159,23 +266,33 @@ uploaded = st.file_uploader("Choose a DealMachine CSV", type=["csv"])
 
 if uploaded is not None:
     content = uploaded.read()
-    df = robust_read_csv(content)
-    if df is None:
+    columns = load_columns(content)
+    if columns is None:
         st.error("Could not read CSV. Try re-exporting or saving with UTF-8 encoding.")
         st.stop()
 
-    if do_trim:
-        df = strip_object_columns(df)
+    optional_cols = [c for c in columns if not always_kept(c)]
+    keep_cols = st.sidebar.multiselect(
+        "Keep columns",
+        options=optional_cols,
+        default=optional_cols,
+        help="Columns carried into every exploded row. Dropping ones you don't need makes large files faster and lighter.",
+    )
 
-    contact_idxs = detect_contact_indices(list(df.columns))
+    # multiselect returns picks in click order; key the cache in header order so the same set always hits
+    picked = set(keep_cols)
+    loaded = load_and_explode(content, do_trim, tuple(c for c in optional_cols if c in picked))
+    if loaded is None:
+        st.error("Could not read CSV. Try re-exporting or saving with UTF-8 encoding.")
+        st.stop()
+
+    work, contact_idxs, before = loaded
     if not contact_idxs:
         st.warning("No contact_N_email columns found. This app is tailored to DealMachine’s per-contact export.")
     else:
-        st.info(f"Detected contact slots: {contact_idxs}")
+        st.info(f"Detected contact slots: {sorted(contact_idxs)}")
 
     st.write("**Step 2. Explode to one email per row (with matched flags)**")
-    before = len(df)
-    work = explode_by_contacts(df, contact_idxs)
     st.write(f"Exploded → rows: {before:,} → {len(work):,}")
 
     # Safety: ensure required columns exist
@@ -184,61 +301,63 @@ if uploaded is not None:
     if "Flags" not in work.columns:
         work["Flags"] = pd.NA
 
+    # Every filter below only narrows one boolean mask; rows are materialized once at the end.
+    # Counts are taken on the rows still kept, so they match applying the filters in sequence.
+    keep = pd.Series(True, index=work.index)
+
     if drop_no_email:
-        work = work.dropna(subset=["Email"])
-        st.write(f"Dropped rows without Email → {len(work):,}")
+        keep &= work["Email"].notna()
+        st.write(f"Dropped rows without Email → {int(keep.sum()):,}")
 
     if filter_valid and "Email" in work.columns:
-        b = len(work)
-        work = work[work["Email"].apply(looks_valid_email)]
-        st.write(f"Filtered invalid-looking emails → removed {b - len(work):,} rows")
-
-    # Phrase sets (lowercased comparisons)
-    renters_only = [
-        "resident, likely renting",
-        "likely renting",
-        "renter",
-    ]
-    owner_excl = [
-        "likely owner, resident",
-        "likely owner",
-        "likely owner, family",
-    ]
-
-    def flags_match(flags_val: str, targets: list[str]) -> bool:
-        if pd.isna(flags_val):
-            return False
-        f = str(flags_val).lower()
-        return any(t in f for t in targets)
+        emails = work["Email"].astype("string[pyarrow]")
+        # Exports repeat the same address across rows/slots, so regex each distinct one once.
+        # Pattern string + case=False runs in Arrow's regex kernel (it can't take an re.Pattern).
+        # Padding doesn't count against an address (with trimming off it reaches here as-is).
+        uniq = pd.Series(emails.dropna().unique(), dtype="string[pyarrow]")
+        valid = emails.isin(uniq[uniq.str.strip().str.fullmatch(VALID_EMAIL_RE.pattern, case=False)])
+        st.write(f"Filtered invalid-looking emails → removed {int((keep & ~valid).sum()):,} rows")
+        keep &= valid
 
     # --- SAFETY: use a guarded series so we never KeyError ---
     flags_series = work["Flags"] if "Flags" in work.columns else pd.Series(pd.NA, index=work.index)
+    # Phrase-match the distinct Flags values only, then filter rows by category code
+    flags_cat = flags_series.astype("category")
+
+    def flagged(pattern: re.Pattern) -> pd.Series:
+        return flags_cat.isin([c for c in flags_cat.cat.categories if pattern.search(str(c))])
 
     # Apply mode logic using the safe Flags series
     if mode.startswith("Owners"):
         # Owners list — remove renters
-        mask_remove = flags_series.apply(lambda v: flags_match(v, renters_only))
-        removed = int(mask_remove.sum())
-        work = work.loc[~mask_remove].copy()
+        mask_remove = flagged(RENTER_RE)
+        removed = int((keep & mask_remove).sum())
+        keep &= ~mask_remove
         st.info(f"Owners list: removed {removed:,} renter-flagged rows.")
     else:
         # Renters list — remove 'Likely Owner…'
-        mask_remove = flags_series.apply(lambda v: flags_match(v, owner_excl))
-        removed = int(mask_remove.sum())
-        work = work.loc[~mask_remove].copy()
+        mask_remove = flagged(OWNER_RE)
+        removed = int((keep & mask_remove).sum())
+        keep &= ~mask_remove
         st.info(f"Renters list: removed {removed:,} 'Likely Owner…' rows (owners removed).")
 
     if dedupe_by_email and "Email" in work.columns:
-        b = len(work)
-        work = work.drop_duplicates(subset=["Email"], keep="first")
-        st.write(f"De-duplicated by Email → removed {b - len(work):,} rows")
+        # Single hash pass over the (already lowercased) Email column, among surviving rows only
+        dup = work["Email"][keep].duplicated(keep="first").reindex(work.index, fill_value=False)
+        st.write(f"De-duplicated by Email → removed {int(dup.sum()):,} rows")
+        keep &= ~dup
+
+    work = work.loc[keep]
 
     st.success(f"Done. {len(work):,} rows ready for verification.")
 
     with st.expander("Preview cleaned data", expanded=False):
         st.dataframe(work.head(50), use_container_width=True)
 
-    cleaned_bytes = work.to_csv(index=False).encode("utf-8")
+    # Write straight to bytes instead of building the whole CSV as a str and re-encoding it
+    buf = io.BytesIO()
+    work.to_csv(buf, index=False, encoding="utf-8")
+    cleaned_bytes = buf.getvalue()
     st.download_button(
         "⬇️ Download cleaned CSV",
         data=cleaned_bytes,
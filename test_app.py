@@ -0,0 +1,172 @@
+import io
+import time
+
+import pytest
+from streamlit.testing.v1 import AppTest, element_tree
+
+from app import EMAIL_RE, detect_contact_indices, explode_by_contacts, load_and_explode, load_columns, robust_read_csv
+
+
+# AppTest can only drive st.file_uploader from streamlit 1.56 on
+needs_upload = pytest.mark.skipif(
+    not hasattr(element_tree, "FileUploader"), reason="AppTest has no file_uploader support"
+)
+
+
+# Slots out of header order, a repeated address in one cell, an empty row, an address
+# EMAIL_RE extracts but the validity check rejects, padded Flags
+EXPORT = (
+    b"id,name,contact_2_email,contact_2_flags,contact_1_email,contact_1_flags\n"
+    b'1,Ann,"B@x.com; b@x.com",Likely Renting , a@x.com,  Likely Owner\n'
+    b"2,Bob,,,,\n"
+    b"3,Cy,c@x.com,,junk e..f@x.com,Renter\n"
+    b"4,Di,a@x.com,,d@x,Resident\n"
+)
+
+
+def rows(df) -> list[list]:
+    return df.astype(object).where(df.notna(), None).values.tolist()
+
+
+def run_app(data: bytes, unchecked: tuple[str, ...] = (), renters: bool = False) -> AppTest:
+    """Run app.py on an upload, with the sidebar checkboxes whose labels start with `unchecked` off."""
+    at = AppTest.from_file("app.py").run()
+    at.radio[0].set_value(at.radio[0].options[1 if renters else 0])
+    for box in at.checkbox:
+        if box.label.startswith(unchecked):
+            box.uncheck()
+    at.file_uploader[0].upload("export.csv", data, "text/csv").run()
+    assert not at.exception
+    return at
+
+
+def test_explode_matches_baseline_rows():
+    df = robust_read_csv(EXPORT)
+    out = explode_by_contacts(df, detect_contact_indices(list(df.columns)))
+    assert list(out.columns) == ["id", "name", "Email", "Flags"]
+    assert rows(out) == [
+        [1, "Ann", "a@x.com", "likely owner"],
+        [1, "Ann", "b@x.com", "likely renting"],
+        [2, "Bob", None, None],
+        [2, "Bob", None, None],
+        [3, "Cy", "e..f@x.com", "renter"],
+        [3, "Cy", "c@x.com", None],
+        [4, "Di", None, "resident"],
+        [4, "Di", "a@x.com", None],
+    ]
+
+
+def test_email_re_stays_linear_on_junk_cells():
+    # Without the lookbehind findall rescans the run from every position (seconds, not ms)
+    start = time.perf_counter()
+    assert EMAIL_RE.findall("a." * 20000 + " x@y.com") == ["x@y.com"]
+    assert time.perf_counter() - start < 1
+
+
+def test_email_re_glued_addresses():
+    # Documented trade-off of the lookbehind: the baseline also returned "_j@k.com"
+    assert EMAIL_RE.findall("h@i.com_j@k.com") == ["h@i.com"]
+    assert EMAIL_RE.findall("h@i.com;j@k.com <l@m.org>") == ["h@i.com", "j@k.com", "l@m.org"]
+
+
+# Step messages and kept rows, as the baseline's sequential filters produced them
+@needs_upload
+@pytest.mark.parametrize(
+    "renters, unchecked, steps, removed, kept",
+    [
+        (
+            False, (),
+            ["Dropped rows without Email → 5", "Filtered invalid-looking emails → removed 1 rows",
+             "De-duplicated by Email → removed 1 rows"],
+            "Owners list: removed 1 renter-flagged rows.",
+            [[1, "Ann", "a@x.com", "likely owner"], [3, "Cy", "c@x.com", None]],
+        ),
+        (
+            False, ("Keep only",),
+            ["Dropped rows without Email → 5", "De-duplicated by Email → removed 1 rows"],
+            "Owners list: removed 2 renter-flagged rows.",
+            [[1, "Ann", "a@x.com", "likely owner"], [3, "Cy", "c@x.com", None]],
+        ),
+        (
+            False, ("De-duplicate",),
+            ["Dropped rows without Email → 5", "Filtered invalid-looking emails → removed 1 rows"],
+            "Owners list: removed 1 renter-flagged rows.",
+            [[1, "Ann", "a@x.com", "likely owner"], [3, "Cy", "c@x.com", None], [4, "Di", "a@x.com", None]],
+        ),
+        (
+            True, ("Drop rows",),
+            ["Filtered invalid-looking emails → removed 4 rows", "De-duplicated by Email → removed 0 rows"],
+            "Renters list: removed 1 'Likely Owner…' rows (owners removed).",
+            [[1, "Ann", "b@x.com", "likely renting"], [3, "Cy", "c@x.com", None], [4, "Di", "a@x.com", None]],
+        ),
+        (
+            True, ("Keep only",),
+            ["Dropped rows without Email → 5", "De-duplicated by Email → removed 0 rows"],
+            "Renters list: removed 1 'Likely Owner…' rows (owners removed).",
+            [[1, "Ann", "b@x.com", "likely renting"], [3, "Cy", "e..f@x.com", "renter"],
+             [3, "Cy", "c@x.com", None], [4, "Di", "a@x.com", None]],
+        ),
+    ],
+)
+def test_filters_match_baseline(renters, unchecked, steps, removed, kept):
+    at = run_app(EXPORT, unchecked=unchecked, renters=renters)
+    assert [m.value for m in at.markdown][2:] == ["Exploded → rows: 4 → 8", *steps]
+    assert [i.value for i in at.info] == ["Detected contact slots: [1, 2]", removed]
+    assert at.success[0].value == f"Done. {len(kept)} rows ready for verification."
+    assert rows(at.dataframe[0].value) == kept
+
+
+def test_blank_header_names_match_column_picker():
+    # One blank header cell, and a trailing comma in the header row (a common export quirk)
+    for data in (
+        b"id,,contact_1_email,contact_1_flags\n1,keepme,a@b.com,owner\n",
+        b"id,contact_1_email,\n1,a@b.com,keepme\n",
+    ):
+        columns = load_columns(data)
+        assert list(robust_read_csv(data).columns) == columns
+
+        keep_cols = tuple(c for c in columns if not c.startswith("contact_"))
+        work, _, _ = load_and_explode(data, True, keep_cols)
+        assert [c for c in columns if c.startswith("Unnamed")][0] in work.columns
+        assert "keepme" in work.astype(str).to_numpy()
+
+
+def test_source_email_flags_survive_pruning():
+    # No contact_N_* slots: the export's own Email/Flags columns feed the filters
+    data = b"id,name,Email,Flags\n1,x,a@b.com,owner\n2,y,c@d.com,renter\n"
+    work, contact_idxs, _ = load_and_explode(data, True, ("id",))
+    assert not contact_idxs
+    assert list(work.columns) == ["id", "Email", "Flags"]
+    assert work["Email"].tolist() == ["a@b.com", "c@d.com"]
+
+
+def test_stray_byte_past_sniff_sample_keeps_every_column():
+    # UTF-8 header, but one latin-1 byte far past chardet's 4 KB sample forces the latin-1 read
+    rows = [b"1,calle 1,a@b.com,owner"] * 20000 + [b"2,caf\xe9,c@d.com,owner"]
+    data = "id,Dirección,contact_1_email,contact_1_flags\n".encode() + b"\n".join(rows) + b"\n"
+    columns = load_columns(data)
+    assert list(robust_read_csv(data).columns) == columns
+
+    keep_cols = tuple(c for c in columns if not c.startswith("contact_"))
+    work, _, _ = load_and_explode(data, True, keep_cols)
+    assert list(work.columns) == [*keep_cols, "Email", "Flags"]
+
+
+@needs_upload
+def test_padded_email_still_counts_as_valid():
+    # With trimming off the export's own Email column reaches the validity filter padded
+    data = b"id,Email,Flags\n1, A@b.com ,owner\n2,c@d,owner\n"
+    at = run_app(data, unchecked=("Trim spaces",))
+    assert at.success[0].value == "Done. 1 rows ready for verification."
+
+
+def test_date_columns_round_trip_unchanged():
+    # pyarrow would type these as date/time/timestamp and the download would be reformatted
+    data = (
+        b"id,sold,seen,at\n"
+        b"1,2023-01-05,2023-01-05T10:00:00Z,08:15\n"
+        b"2,2021-06-30 08:15:00,,09:00:00\n"
+    )
+    buf = io.BytesIO()
+    robust_read_csv(data).to_csv(buf, index=False, lineterminator="\n")
+    assert buf.getvalue() == data